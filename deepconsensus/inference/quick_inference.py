@@ -107,6 +107,14 @@ flags.DEFINE_integer(
 flags.DEFINE_integer(
     'batch_zmws', 20, 'Number of ZMWs to process at the same time. '
     'If 0, process all ZMWs in one batch.')
+flags.DEFINE_bool(
+    'use_xla', False, 'If True, compile the model forward pass with XLA, on '
+    'CPU as well as GPU. The first batch of each shape is slower while it '
+    'compiles.')
+flags.DEFINE_bool(
+    'use_bfloat16', False, 'If True, run the model with the mixed_bfloat16 '
+    'Keras policy, even if the checkpoint was trained in float32. If False, '
+    'use_bfloat16 from the checkpoint params is used.')
 
 # The following parameters are for debugging.
 flags.DEFINE_integer('limit', None, 'Only process this many ZMWs. ')
@@ -191,11 +199,40 @@ def timelog(stage: str,
   return datum
 
 
+def get_predict_fn(model: tf.keras.Model,
+                   use_xla: bool) -> Callable[[np.ndarray], np.ndarray]:
+  """Returns a function that runs the model on one batch of examples.
+
+  Args:
+    model: An initialized model that will be used to make predictions.
+    use_xla: If True, the forward pass is compiled with XLA. Each input shape
+      is compiled once, when the function first sees it.
+
+  Returns:
+    A function from a batch of rows to the softmax output of the model.
+  """
+  if not use_xla:
+    # predict_on_batch reuses the model's compiled predict function across
+    # batches, whereas predict sets up a new data handler on every call and the
+    # transformer models override predict to run eagerly.
+    return model.predict_on_batch
+
+  @tf.function(experimental_compile=True)
+  def _forward(rows: tf.Tensor) -> tf.Tensor:
+    return model(rows, training=False)
+
+  def _predict(rows: np.ndarray) -> np.ndarray:
+    return _forward(tf.convert_to_tensor(rows)).numpy()
+
+  return _predict
+
+
 def run_model_on_examples(
     feature_dict_gen_fn: Callable[[], Dict[str, Union[np.ndarray, int, bytes]]],
     model: tf.keras.Model,
     model_params: Union[config_dict.ConfigDict, config_dict.FrozenConfigDict],
     options: InferenceOptions,
+    predict_fn: Optional[Callable[[np.ndarray], np.ndarray]] = None,
 ) -> List[stitch_utils.DCModelOutput]:
   """Runs the model on one example to get one predicted output sequence.
 
@@ -204,6 +241,8 @@ def run_model_on_examples(
     model: An initialized model that will be used to make predictions.
     model_params: Parameters for the model.
     options: Some options that apply to various stages of the inference run.
+    predict_fn: Function from get_predict_fn used to run the model. If None,
+      model.predict_on_batch is used.
 
   Returns:
     A DeepConsensusInput proto containing the prediction from the model.
@@ -233,10 +272,12 @@ def run_model_on_examples(
   dataset = dataset.batch(batch_size=options.batch_size, drop_remainder=False)
   dataset = dataset.prefetch(tf.data.experimental.AUTOTUNE)
 
+  if predict_fn is None:
+    predict_fn = get_predict_fn(model, use_xla=False)
   predictions = []
   for rows, _, _, window_pos_arr, molecule_name_arr in dataset.as_numpy_iterator(
   ):
-    softmax_output = model.predict(rows)
+    softmax_output = predict_fn(rows)
     y_preds = tf.argmax(softmax_output, -1)
     error_prob = 1 - np.max(softmax_output, axis=-1)
     quality_scores = -10 * np.log10(error_prob)
@@ -343,6 +384,8 @@ def initialize_model(
 
   with params.unlocked():
     params.max_passes = options.max_passes
+    if FLAGS.use_bfloat16:
+      params.use_bfloat16 = True
   logging.info('Loading %s', checkpoint_path)
   model = model_utils.get_model(params)
   # This loads a model saved in tf.train.Checkpoint format through the custom
@@ -414,7 +457,10 @@ def inference_on_n_zmws(inputs: Sequence[Tuple[str, str, Sequence[Any]]],
                         fastq_writer: gfile.GFile,
                         options: InferenceOptions,
                         batch_name: str,
-                        outcome_counter=stitch_utils.OutcomeCounter) -> None:
+                        outcome_counter=stitch_utils.OutcomeCounter,
+                        predict_fn: Optional[Callable[[np.ndarray],
+                                                      np.ndarray]] = None
+                       ) -> None:
   """Runs the full inference process on a batch of ZMWs and writes to fastq.
 
   Args:
@@ -426,6 +472,8 @@ def inference_on_n_zmws(inputs: Sequence[Tuple[str, str, Sequence[Any]]],
     options: Some options that apply to various stages of the inference run.
     batch_name: Name of batch used for runtime metrics.
     outcome_counter: Counts outcomes for each ZMW.
+    predict_fn: Function from get_predict_fn used to run the model. If None,
+      model.predict_on_batch is used.
   """
   before_batch = time.time()
 
@@ -473,7 +521,7 @@ def inference_on_n_zmws(inputs: Sequence[Tuple[str, str, Sequence[Any]]],
       yield from feature_dicts_for_one_zmw
 
   predictions = run_model_on_examples(feature_dict_gen_fn, model, model_params,
-                                      options)
+                                      options, predict_fn)
   timelog(stage='run_model', item=batch_name, before=before)
   if FLAGS.end_after_stage == DebugStage.RUN_MODEL:
     return
@@ -527,6 +575,11 @@ def run() -> stitch_utils.OutcomeCounter:
   before_model_setup = time.time()
   loaded_model, model_params = initialize_model(
       checkpoint_path=FLAGS.checkpoint, params=FLAGS.params, options=options)
+  # Created once so that the compiled forward pass is reused by every batch.
+  # There is no model when ending before the model stage.
+  predict_fn = None
+  if loaded_model is not None:
+    predict_fn = get_predict_fn(loaded_model, FLAGS.use_xla)
   logging.info('Model setup took %s seconds.', time.time() - before_model_setup)
 
   # Initialize output fastq writer.
@@ -564,7 +617,8 @@ def run() -> stitch_utils.OutcomeCounter:
           fastq_writer=fastq_writer,
           options=options,
           batch_name=f'batch {batch_count}: {len(stored_n_zmws)} ZMWs',
-          outcome_counter=outcome_counter)
+          outcome_counter=outcome_counter,
+          predict_fn=predict_fn)
       batch_count += 1
       stored_n_zmws = []
       logging.info('Processed %s ZMWs in %f seconds', zmw_counter,
@@ -578,7 +632,8 @@ def run() -> stitch_utils.OutcomeCounter:
         fastq_writer=fastq_writer,
         options=options,
         batch_name=f'batch {batch_count}: {len(stored_n_zmws)} ZMWs',
-        outcome_counter=outcome_counter)
+        outcome_counter=outcome_counter,
+        predict_fn=predict_fn)
 
   fastq_writer.close()
 
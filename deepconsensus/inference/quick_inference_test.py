@@ -27,6 +27,8 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """Tests for quick_inference."""
 
+import os
+
 from absl import flags
 from absl import logging
 from absl.testing import absltest
@@ -84,9 +86,10 @@ class QuickInferenceTest(parameterized.TestCase):
 
   @parameterized.parameters(
       dict(cpus=0, batch_zmws=1), dict(cpus=0, batch_zmws=0),
-      dict(cpus=1, batch_zmws=1), dict(cpus=1, batch_zmws=100))
+      dict(cpus=1, batch_zmws=1), dict(cpus=1, batch_zmws=100),
+      dict(cpus=0, batch_zmws=1, use_xla=True))
   @flagsaver.flagsaver
-  def test_end_to_end_multiprocessing(self, cpus, batch_zmws):
+  def test_end_to_end_multiprocessing(self, cpus, batch_zmws, use_xla=False):
     FLAGS.subreads_to_ccs = test_utils.deepconsensus_testdata(
         'human_1m/subreads_to_ccs.bam')
     FLAGS.ccs_fasta = test_utils.deepconsensus_testdata('human_1m/ccs.fasta')
@@ -95,6 +98,7 @@ class QuickInferenceTest(parameterized.TestCase):
     FLAGS.output = output_path
     FLAGS.batch_zmws = batch_zmws
     FLAGS.cpus = cpus
+    FLAGS.use_xla = use_xla
     FLAGS.min_quality = 0  # Qualities are lower due to tiny sample model.
     FLAGS.limit = 2
     outcomes = quick_inference.run()
@@ -109,6 +113,24 @@ class QuickInferenceTest(parameterized.TestCase):
     self.assertEqual(count, 2)
     self.assertEqual(outcomes.success, 2)
 
+  @parameterized.parameters(quick_inference.DebugStage.DC_INPUT,
+                            quick_inference.DebugStage.TF_EXAMPLES)
+  @flagsaver.flagsaver
+  def test_end_after_stage_without_model(self, end_after_stage):
+    FLAGS.subreads_to_ccs = test_utils.deepconsensus_testdata(
+        'human_1m/subreads_to_ccs.bam')
+    FLAGS.ccs_fasta = test_utils.deepconsensus_testdata('human_1m/ccs.fasta')
+    FLAGS.checkpoint = test_utils.deepconsensus_testdata('model/checkpoint-1')
+    output_path = test_utils.test_tmpfile('output_path.fastq')
+    FLAGS.output = output_path
+    FLAGS.end_after_stage = end_after_stage
+    FLAGS.use_xla = True
+    FLAGS.limit = 2
+    outcomes = quick_inference.run()
+
+    self.assertEqual(os.path.getsize(output_path), 0)
+    self.assertEqual(outcomes.success, 0)
+
 
 if __name__ == '__main__':
   absltest.main()
@@ -125,16 +125,25 @@ def format_rows(
     rows = tf.concat([base_rows, pw_rows, ip_rows, ccs_rows, sn_rows], axis=-1)
     if params.max_passes < 32:
       rows = tf.image.pad_to_bounding_box(rows, 0, 0, 32, params.max_length)
-    num_rows = max(params.max_passes, 32)
   else:
     rows = tf.concat(
         [base_rows, pw_rows, ip_rows, strand_rows, ccs_rows, sn_rows], axis=0)
-    num_rows = get_total_rows(params.max_passes)
 
-  rows.set_shape((num_rows, params.max_length, params.num_channels))
+  rows.set_shape(get_input_shape(params))
   return rows
 
 
+def get_input_shape(
+    params: Union[ml_collections.ConfigDict, ml_collections.FrozenConfigDict]
+) -> Tuple[int, int, int]:
+  """Returns the shape of one model input, as produced by format_rows."""
+  if params.get('input_format') == 'stack[base,pw,ip,sn]':
+    num_rows = max(params.max_passes, 32)
+  else:
+    num_rows = get_total_rows(params.max_passes)
+  return (num_rows, params.max_length, params.num_channels)
+
+
 def process_feature_dict(
     features: Dict[str, tf.Tensor],
     params: Union[config_dict.ConfigDict, config_dict.FrozenConfigDict],
@@ -258,8 +267,15 @@ def get_dataset(file_pattern: str,
         inference=inference)
 
   file_patterns = create_glob_list(file_pattern)
-  ds = tf.data.TFRecordDataset(file_patterns, compression_type='GZIP')
-  ds = ds.map(map_func=_process_input_helper)
+  # Read and parse shards in parallel so gzip decoding overlaps with the model.
+  ds = tf.data.TFRecordDataset(
+      file_patterns,
+      compression_type='GZIP',
+      num_parallel_reads=tf.data.AUTOTUNE)
+  ds = ds.map(
+      map_func=_process_input_helper,
+      num_parallel_calls=tf.data.AUTOTUNE,
+      deterministic=False)
   ds = ds.shuffle(buffer_size=params.buffer_size, reshuffle_each_iteration=True)
   if num_epochs:
     ds = ds.repeat(num_epochs)
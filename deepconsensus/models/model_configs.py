@@ -223,6 +223,10 @@ def get_config(config_name: str) -> ml_collections.ConfigDict:
   params.loss_reg = 0.1
 
 
+  # Run models with the mixed_bfloat16 Keras policy. Variables and the output
+  # distribution stay in float32.
+  params.use_bfloat16 = False
+
   # Scaling factor to multiply the batch_size when using TPUs since they have
   # more memory than GPUs.
   params.tpu_scale_factor = 1
@@ -64,6 +64,10 @@ flags.DEFINE_string('tpu_topology', None, 'Tpu topology.')
 flags.DEFINE_integer(
     'limit', -1, 'Limit to N records per train/tune dataset. '
     '-1 will evaluate all examples.')
+flags.DEFINE_bool(
+    'use_bfloat16', False, 'If True, run the model with the mixed_bfloat16 '
+    'Keras policy, even if the checkpoint was trained in float32. If False, '
+    'use_bfloat16 from the checkpoint params is used.')
 
 
 def run_inference(out_dir: str, params: ml_collections.ConfigDict,
@@ -103,6 +107,9 @@ def main(unused_args=None):
     params = model_utils.read_params_from_json(checkpoint_path=FLAGS.checkpoint)
   else:
     params = FLAGS.params
+  if FLAGS.use_bfloat16:
+    with params.unlocked():
+      params.use_bfloat16 = True
   run_inference(FLAGS.out_dir, params, FLAGS.checkpoint, FLAGS.tpu,
                 FLAGS.tpu_topology, FLAGS.limit)
 
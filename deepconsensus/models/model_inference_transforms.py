@@ -27,10 +27,15 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """DoFns for running inference with Beam and writing out predictions."""
 
-import itertools
+from typing import Sequence, Tuple
+
+import numpy as np
 
 from deepconsensus.utils import dc_constants
 
+# Number of pattern positions that fit in one word of `edit_distances`.
+_LANE_BITS = 64
+
 
 def edit_distance(s1: str, s2: str) -> int:
   """Calculates the Levenstein edit distance.
@@ -49,33 +54,176 @@ def edit_distance(s1: str, s2: str) -> int:
     The Levenstein edit distance.
 
   """
-  if len(s1) > len(s2):
-    s1, s2 = s2, s1
-
   # Remove all gaps/padding from strings.
   s1 = s1.replace(dc_constants.GAP_OR_PAD, '')
-  s1 = s1.replace(dc_constants.GAP_OR_PAD, '')
-  s2 = s2.replace(dc_constants.GAP_OR_PAD, '')
   s2 = s2.replace(dc_constants.GAP_OR_PAD, '')
+  return _edit_distance_without_gaps(s1, s2)
+
+
+def _edit_distance_without_gaps(s1: str, s2: str) -> int:
+  """Calculates the edit distance for strings with gaps already removed."""
+  # Use the shorter string as the pattern so the bit vectors stay small.
+  if len(s1) > len(s2):
+    s1, s2 = s2, s1
+  if not s1:
+    return len(s2)
+
+  # Myers' bit-parallel algorithm (Myers 1999, Hyyro 2001). One column of the
+  # DP matrix is encoded in the positive (pv) and negative (mv) vertical delta
+  # bit vectors, so each character of s2 is processed with a handful of
+  # bitwise operations instead of a loop over s1. Python ints are arbitrary
+  # precision, so patterns longer than a machine word work as well.
+  peq = {}
+  for i, c in enumerate(s1):
+    peq[c] = peq.get(c, 0) | (1 << i)
+  mask = (1 << len(s1)) - 1
+  last_bit = 1 << (len(s1) - 1)
+  pv = mask
+  mv = 0
+  distance = len(s1)
+  for c in s2:
+    eq = peq.get(c, 0)
+    xv = eq | mv
+    xh = (((eq & pv) + pv) ^ pv) | eq
+    ph = mv | (~(xh | pv) & mask)
+    mh = pv & xh
+    if ph & last_bit:
+      distance += 1
+    elif mh & last_bit:
+      distance -= 1
+    # Shifting in a 1 accounts for the first row of the DP matrix.
+    ph = ((ph << 1) | 1) & mask
+    mh = (mh << 1) & mask
+    pv = mh | (~(xv | ph) & mask)
+    mv = ph & xv
+  return distance
+
+
+def edit_distances(pairs: Sequence[Tuple[str, str]]) -> np.ndarray:
+  """Calculates the Levenstein edit distance for many pairs of strings.
+
+  Runs the same bit-parallel algorithm as `edit_distance` for all pairs at
+  once. The pattern (shorter string) of each pair is split into 64-bit words,
+  and every word of every pair is advanced by one text character with a single
+  set of NumPy operations. The carry between words follows the block form of
+  Myers' algorithm, so patterns of any length are supported.
+
+  Args:
+    pairs: Sequence of (s1, s2) string pairs.
+
+  Returns:
+    Array with the edit distance for each pair.
+  """
+  distances = np.zeros(len(pairs), dtype=np.int64)
+  patterns = []
+  texts = []
+  lanes = []
+  for n, (s1, s2) in enumerate(pairs):
+    s1 = s1.replace(dc_constants.GAP_OR_PAD, '')
+    s2 = s2.replace(dc_constants.GAP_OR_PAD, '')
+    if len(s1) > len(s2):
+      s1, s2 = s2, s1
+    if not s1:
+      distances[n] = len(s2)
+    else:
+      patterns.append(s1)
+      texts.append(s2)
+      lanes.append(n)
+  if not lanes:
+    return distances
 
-  distances = range(len(s1) + 1)
-  for i2, c2 in enumerate(s2):
-    distances_ = [i2 + 1]
-    for i1, c1 in enumerate(s1):
-      if c1 == c2:
-        distances_.append(distances[i1])
-      else:
-        distances_.append(1 + min((distances[i1], distances[i1 + 1],
-                                   distances_[-1])))
-    distances = distances_
-  return distances[-1]
+  num_lanes = len(lanes)
+  pattern_lens = np.array([len(x) for x in patterns])
+  text_lens = np.array([len(x) for x in texts])
+  num_words = -(-pattern_lens.max() // _LANE_BITS)
+  # Zero never matches a text character, so it pads patterns to whole words.
+  pattern_arr = np.zeros((num_lanes, num_words * _LANE_BITS), dtype=np.uint32)
+  text_arr = np.zeros((num_lanes, text_lens.max()), dtype=np.uint32)
+  for i, (pattern, text) in enumerate(zip(patterns, texts)):
+    pattern_arr[i, :len(pattern)] = [ord(c) for c in pattern]
+    text_arr[i, :len(text)] = [ord(c) for c in text]
+
+  # peq[n, s, w] has bit i set when position w * 64 + i of pattern n is
+  # symbols[s]. Text characters are replaced by their symbol index so that the
+  # match words for one text column can be gathered from peq.
+  symbols, text_arr = np.unique(text_arr, return_inverse=True)
+  text_arr = text_arr.reshape(num_lanes, -1)
+  peq = np.stack([
+      np.packbits(pattern_arr == symbol, axis=-1,
+                  bitorder='little').view('<u8') for symbol in symbols
+  ], axis=1)
+
+  # Only the bit for the last pattern position contributes to the distance.
+  one = np.uint64(1)
+  high_bit = np.uint64(_LANE_BITS - 1)
+  last_word = (pattern_lens - 1) // _LANE_BITS
+  last_bit = one << ((pattern_lens - 1) % _LANE_BITS).astype(np.uint64)
+  pv = np.full((num_lanes, num_words), np.uint64(0xFFFFFFFFFFFFFFFF))
+  mv = np.zeros((num_lanes, num_words), dtype=np.uint64)
+  lane_distances = pattern_lens.astype(np.int64)
+  lane_index = np.arange(num_lanes)
+  for j in range(text_arr.shape[1]):
+    active = j < text_lens
+    eq_words = peq[lane_index, text_arr[:, j]]
+    # The first row of the DP matrix increases by one in every column.
+    hin = np.ones(num_lanes, dtype=np.int64)
+    for w in range(num_words):
+      eq = eq_words[:, w]
+      pv_w = pv[:, w]
+      mv_w = mv[:, w]
+      xv = eq | mv_w
+      eq = eq | (hin < 0).astype(np.uint64)
+      xh = (((eq & pv_w) + pv_w) ^ pv_w) | eq
+      ph = mv_w | ~(xh | pv_w)
+      mh = pv_w & xh
+      at_end = active & (last_word == w)
+      lane_distances += at_end & ((ph & last_bit) != 0)
+      lane_distances -= at_end & ((mh & last_bit) != 0)
+      hout = (ph >> high_bit).astype(np.int64) - (mh >> high_bit).astype(
+          np.int64)
+      ph = (ph << one) | (hin > 0).astype(np.uint64)
+      mh = (mh << one) | (hin < 0).astype(np.uint64)
+      pv[:, w] = np.where(active, mh | ~(xv | ph), pv_w)
+      mv[:, w] = np.where(active, ph & xv, mv_w)
+      hin = hout
+  distances[lanes] = lane_distances
+  return distances
 
 
 def homopolymer_content(seq: str) -> float:
   """Calculates proportion of seq composed of 3+ repeated bases."""
-  seq = seq.replace(dc_constants.GAP_OR_PAD, '').strip(dc_constants.GAP_OR_PAD)
-  if not seq:
+  arr = np.frombuffer(seq.encode(), dtype=np.uint8)
+  arr = arr[arr != ord(dc_constants.GAP_OR_PAD)]
+  return _homopolymer_content_without_gaps(arr)
+
+
+def _homopolymer_content_without_gaps(arr: np.ndarray) -> float:
+  """Calculates homopolymer content for an encoded seq without gaps."""
+  if not arr.size:
     return 0.0
-  run_length_encoding = [len(list(g)) for _, g in itertools.groupby(seq)]
-  hcontent = sum([x for x in run_length_encoding if x >= 3]) / len(seq)
-  return round(hcontent, 2)
+  # Run lengths are the distances between positions where the base changes.
+  run_starts = np.flatnonzero(np.r_[True, arr[1:] != arr[:-1], True])
+  run_lengths = np.diff(run_starts)
+  hcontent = run_lengths[run_lengths >= 3].sum() / arr.size
+  return round(float(hcontent), 2)
+
+
+def score_pair(pred: str, label: str) -> Tuple[int, float, int]:
+  """Calculates all per-example scores for a prediction and its label.
+
+  Gaps and padding are removed once and the stripped sequences are shared by
+  all scores, rather than each score stripping its inputs again.
+
+  Args:
+    pred: Predicted sequence.
+    label: Label sequence.
+
+  Returns:
+    The edit distance between pred and label, the homopolymer content of the
+    label, and the length of the label without gaps.
+  """
+  pred = pred.replace(dc_constants.GAP_OR_PAD, '')
+  label = label.replace(dc_constants.GAP_OR_PAD, '')
+  label_arr = np.frombuffer(label.encode(), dtype=np.uint8)
+  return (_edit_distance_without_gaps(pred, label),
+          _homopolymer_content_without_gaps(label_arr), len(label))
@@ -40,11 +40,31 @@ class EditDistanceTest(parameterized.TestCase):
       ['ATCG', 'TT', 3],
       ['ATCG', 'ZZZZ', 4],
       [' A T C G  ', 'ATCG', 0],
+      ['ATCG' * 30, 'ATCG' * 29 + 'ATG', 1],
   ])
   def test_edit_distance(self, str1, str2, expected_edit_distance):
     ed = model_inference_transforms.edit_distance(str1, str2)
     self.assertEqual(ed, expected_edit_distance)
 
+  def test_edit_distances(self):
+    pairs = [
+        ('ATCG', 'ATCG'),
+        ('ATCG', 'TT'),
+        ('ATCG', 'ZZZZ'),
+        (' A T C G  ', 'ATCG'),
+        ('', 'ATCG'),
+        ('A' * 64, 'A' * 63 + 'T'),
+        ('ATCG' * 30, 'ATCG' * 29 + 'ATG'),
+        ('A' * 65, 'T' * 65),
+        ('ATCG' * 25, 'ATCG' * 12 + 'AT G' + 'ATCG' * 12 + ' ' * 20),
+        ('ACGT' * 50, 'ACGA' * 50),
+    ]
+    eds = model_inference_transforms.edit_distances(pairs)
+    expected = [
+        model_inference_transforms.edit_distance(s1, s2) for s1, s2 in pairs
+    ]
+    self.assertEqual(list(eds), expected)
+
 
 class RepeatContentTest(parameterized.TestCase):
 
@@ -56,5 +76,15 @@ class RepeatContentTest(parameterized.TestCase):
     self.assertEqual(hcontent, expected_homopolymer_content)
 
 
+class ScorePairTest(parameterized.TestCase):
+
+  @parameterized.parameters([['ATCG', 'ATCG', (0, 0.0, 4)],
+                             ['A T C G', 'AAATTTCG', (4, 0.75, 8)],
+                             ['', '    ', (0, 0.0, 0)]])
+  def test_score_pair(self, pred, label, expected_scores):
+    scores = model_inference_transforms.score_pair(pred, label)
+    self.assertEqual(scores, expected_scores)
+
+
 if __name__ == '__main__':
   absltest.main()
@@ -27,10 +27,11 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """Utilities for running training and inference."""
 
+import functools
 import json
 import logging
 import os
-from typing import List, Optional, Tuple
+from typing import Callable, List, Optional, Tuple, Union
 
 import ml_collections
 import numpy as np
@@ -77,27 +78,111 @@ def get_deepconsensus_metrics(name_prefix='') -> List[tf.keras.metrics.Metric]:
   ] + per_class_accuracy_metrics
 
 
-def get_record_shape(dataset_path: str) -> List[int]:
+def _summary_candidates(tfrecord_file: str) -> List[Tuple[str, str]]:
+  """Returns (summary path, split) pairs preprocess may have used for a file.
+
+  preprocess writes each split to --output with @split replaced by the split
+  name, and the summary to --output with @split replaced by 'summary' and the
+  .tfrecord.gz suffix replaced by .training.json or .inference.json. For
+  example, --output=examples-@split.tfrecord.gz writes
+  examples-train.tfrecord.gz next to examples-summary.training.json, and
+  --output=@split/@split.tfrecord.gz writes train/train.tfrecord.gz and
+  summary/summary.training.json. The split name is not known here, so every
+  suffix of the file name that follows a separator is tried.
+
+  Args:
+    tfrecord_file: path to one TFRecord file.
+
+  Returns:
+    Candidate summary paths, each with the split it would describe.
+  """
+  suffix = '.tfrecord.gz'
+  dirname, basename = os.path.split(tfrecord_file)
+  if not basename.endswith(suffix):
+    return []
+  stem = basename[:-len(suffix)]
+  splits = [stem] + [
+      stem[i + 1:] for i, c in enumerate(stem[:-1]) if c in '-_.'
+  ]
+  candidates = []
+  for split in splits:
+    summary_stem = stem[:-len(split)] + 'summary'
+    summary_dirs = [dirname]
+    if os.path.basename(dirname) == split:
+      summary_dirs.append(os.path.join(os.path.dirname(dirname), 'summary'))
+    for summary_dir in summary_dirs:
+      for summary_name in ['training', 'inference']:
+        candidates.append((os.path.join(
+            summary_dir, f'{summary_stem}.{summary_name}.json'), split))
+  return candidates
+
+
+def read_shape_from_summary(tfrecord_file: str) -> Optional[List[int]]:
+  """Returns the subreads shape from the preprocess summary, if any.
+
+  The summary written by preprocess includes the tensor_height and
+  tensor_width of every example. A summary is only used if it counts examples
+  for the split of `tfrecord_file`, so that summaries of other datasets in the
+  same directory are ignored.
+
+  Args:
+    tfrecord_file: path to one TFRecord file.
+
+  Returns:
+    The [hidden_size, max_length, channels] shape, or None if no matching
+    summary is found.
+  """
+  for summary_path, split in _summary_candidates(tfrecord_file):
+    if not tf.io.gfile.exists(summary_path):
+      continue
+    with tf.io.gfile.GFile(summary_path, 'r') as summary_file:
+      summary = json.load(summary_file)
+    if (f'n_examples_{split}' in summary and 'tensor_height' in summary and
+        'tensor_width' in summary):
+      # preprocess writes examples with a single channel.
+      return [int(summary['tensor_height']), int(summary['tensor_width']), 1]
+  return None
+
+
+def get_record_shape(dataset_path: Union[str, List[str]]) -> List[int]:
   """Returns an array that represents the shape of records in the given path.
 
   Input `dataset_path` should look something like
   /path/to/data/train/train, where the actual TFRecords are named something
   like /path/to/data/train/train-00228-of-00724.tfrecords.gz
 
+  The shape is read from the preprocess summary when available, otherwise the
+  first record is parsed. Results are cached per path for the lifetime of the
+  process, so if the files at a path are rewritten with a different shape,
+  the old shape is still returned.
+
   Args:
-    dataset_path: string representing the sharded path for TFRecords. These
-      records should be zipped tf.Examples protos with a subreads/shape field.
-      This field has three values representing [hidden_size, max_length,
-      channels].
+    dataset_path: string or list of strings representing the sharded path for
+      TFRecords. These records should be zipped tf.Examples protos with a
+      subreads/shape field. This field has three values representing
+      [hidden_size, max_length, channels].
 
   Raises:
     Exception: If no tfrecord files are found.
   """
+  if not isinstance(dataset_path, str):
+    dataset_path = tuple(dataset_path)
+  return list(_get_record_shape(dataset_path))
+
+
+@functools.lru_cache(maxsize=32)
+def _get_record_shape(
+    dataset_path: Union[str, Tuple[str, ...]]) -> Tuple[int, ...]:
+  """Cached implementation of get_record_shape for hashable paths."""
   tfrecord_files = data_providers.create_glob_list(dataset_path)
+  if tfrecord_files:
+    shape = read_shape_from_summary(tfrecord_files[0])
+    if shape is not None:
+      return tuple(shape)
   records = tf.data.TFRecordDataset(
       tfrecord_files, compression_type='GZIP').as_numpy_iterator()
   features = data_providers.parse_example(next(records))
-  return list(map(int, features['subreads/shape'].numpy()))
+  return tuple(map(int, features['subreads/shape'].numpy()))
 
 
 def extract_max_length(dataset_sharded_path: str) -> int:
@@ -112,6 +197,27 @@ def extract_example_height(dataset_sharded_path: str) -> int:
 
 def get_model(params: ml_collections.ConfigDict) -> tf.keras.Model:
   """Returns desired model based on the given params."""
+  # The global policy only applies to layers created while it is set, and some
+  # layers (e.g. the transformer encoder stack) are only created when the model
+  # is first called. Call the model once on zeros of the real input shape under
+  # the requested policy, then restore the previous policy so that it does not
+  # leak into models created later. Calling the model rather than
+  # Model.build also autocasts the inputs, as in every later call.
+  policy = 'mixed_bfloat16' if params.get('use_bfloat16', False) else 'float32'
+  previous_policy = tf.keras.mixed_precision.global_policy()
+  tf.keras.mixed_precision.set_global_policy(policy)
+  try:
+    model = _create_model(params)
+    model(
+        tf.zeros((1,) + data_providers.get_input_shape(params)),
+        training=False)
+  finally:
+    tf.keras.mixed_precision.set_global_policy(previous_policy)
+  return model
+
+
+def _create_model(params: ml_collections.ConfigDict) -> tf.keras.Model:
+  """Creates the model for params.model_name under the current policy."""
   if params.model_name == 'fc':
     model = networks.FullyConnectedNet(params)
   elif params.model_name == 'conv_net':
@@ -127,6 +233,28 @@ def get_model(params: ml_collections.ConfigDict) -> tf.keras.Model:
 
 
 
+def _hidden_size_fn(
+    params: ml_collections.ConfigDict) -> Callable[[int], int]:
+  """Returns a function of max_passes giving the learned embeddings size.
+
+  The use_* flags and embedding sizes are folded into two constants once, so
+  the returned function only needs a multiply and an add.
+
+  Args:
+    params: Config dictionary of the parameters to use.
+
+  Returns:
+    Function mapping max_passes to the concatenated embedding size.
+  """
+  per_pass_size = ((params.use_bases * params.per_base_hidden_size) +
+                   (params.use_pw * params.pw_hidden_size) +
+                   (params.use_ip * params.ip_hidden_size) +
+                   (params.use_strand * params.strand_hidden_size))
+  fixed_size = ((params.use_sn * params.sn_hidden_size * 4) +
+                (params.use_ccs * params.per_base_hidden_size))
+  return lambda max_passes: max_passes * per_pass_size + fixed_size
+
+
 def del_param(params, name):
   if name in params:
     del params[name]
@@ -204,13 +332,7 @@ def modify_params(params: ml_collections.ConfigDict,
       params.max_length = extract_max_length(params.train_path)
 
     if params.model_name == 'transformer_learn_values':
-      dim = ((params.use_bases * params.per_base_hidden_size) +
-             (params.use_pw * params.pw_hidden_size) +
-             (params.use_ip * params.ip_hidden_size) +
-             (params.use_strand * params.strand_hidden_size))
-      params.hidden_size = ((params.max_passes * dim) +
-                            (params.use_sn * params.sn_hidden_size * 4) +
-                            (params.use_ccs * params.per_base_hidden_size))
+      params.hidden_size = _hidden_size_fn(params)(params.max_passes)
     else:
       params.hidden_size = data_providers.get_total_rows(params.max_passes)
 
@@ -27,20 +27,23 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """Tests for deepconsensus.models.model_utils."""
 
+import json
 import os
 import uuid
 
 from absl.testing import absltest
 from absl.testing import parameterized
 
+import numpy as np
 import tensorflow as tf
 
+from deepconsensus.models import data_providers
 from deepconsensus.models import model_configs
 from deepconsensus.models import model_utils
 from deepconsensus.utils import test_utils
 
 
-class GetModelTest(absltest.TestCase):
+class GetModelTest(parameterized.TestCase):
 
   def test_valid_model_name(self):
     """Tests that correct model name works."""
@@ -59,6 +62,96 @@ class GetModelTest(absltest.TestCase):
       params.model_name = 'incorrect_name'
       model_utils.get_model(params)
 
+  def test_bfloat16_model(self):
+    """Tests that use_bfloat16 predictions match the float32 model."""
+
+    checkpoint_path = test_utils.deepconsensus_testdata('model/checkpoint-1')
+    models = {}
+    for use_bfloat16 in [False, True]:
+      params = model_configs.get_config('transformer_learn_values+test')
+      params.use_bfloat16 = use_bfloat16
+      model_utils.modify_params(params)
+      model = model_utils.get_model(params)
+      tf.train.Checkpoint(model=model).restore(
+          checkpoint_path).assert_existing_objects_matched()
+      models[use_bfloat16] = model
+    self.assertEqual(models[True].compute_dtype, 'bfloat16')
+    self.assertEqual(models[True].dtype, 'float32')
+    self.assertEqual(models[False].compute_dtype, 'float32')
+
+    dataset = data_providers.get_dataset(
+        file_pattern=params.train_path,
+        num_epochs=1,
+        batch_size=8,
+        params=params,
+        inference=False)
+    rows, _ = next(dataset.as_numpy_iterator())
+    float32_output = models[False](rows, training=False).numpy()
+    bfloat16_output = models[True](rows, training=False)
+    self.assertEqual(bfloat16_output.dtype, tf.float32)
+    bfloat16_output = bfloat16_output.numpy()
+    np.testing.assert_allclose(bfloat16_output, float32_output, atol=0.05)
+    # Only compare predictions that are not within bfloat16 rounding of a tie.
+    top_two = np.sort(float32_output, axis=-1)[..., -2:]
+    confident = top_two[..., 1] - top_two[..., 0] > 0.1
+    self.assertTrue(confident.any())
+    np.testing.assert_array_equal(
+        np.argmax(bfloat16_output, -1)[confident],
+        np.argmax(float32_output, -1)[confident])
+
+  def test_checkpoint_restores_all_variables(self):
+    """Tests that every model variable is restored from the checkpoint."""
+
+    checkpoint_path = test_utils.deepconsensus_testdata('model/checkpoint-1')
+    params = model_utils.read_params_from_json(checkpoint_path=checkpoint_path)
+    model = model_utils.get_model(params)
+    tf.train.Checkpoint(model=model).restore(
+        checkpoint_path).assert_existing_objects_matched()
+
+  @parameterized.parameters([
+      'fc+test',
+      'conv_net-resnet50+test',
+      'transformer+test',
+      'transformer_learn_values+test',
+  ])
+  def test_bfloat16_outputs(self, config_name):
+    """Tests that every model builds and runs with use_bfloat16."""
+
+    params = model_configs.get_config(config_name)
+    params.use_bfloat16 = True
+    model_utils.modify_params(params)
+    model = model_utils.get_model(params)
+    self.assertEqual(model.compute_dtype, 'bfloat16')
+    dataset = data_providers.get_dataset(
+        file_pattern=params.train_path,
+        num_epochs=1,
+        batch_size=params.batch_size,
+        params=params,
+        inference=True)
+    rows, _ = next(dataset.as_numpy_iterator())
+    softmax_output = model(rows, training=False)
+    self.assertEqual(softmax_output.dtype, tf.float32)
+    self.assertEqual(softmax_output.shape,
+                     (params.batch_size, params.max_length, params.num_classes))
+    np.testing.assert_allclose(
+        np.sum(softmax_output.numpy(), axis=-1), 1.0, rtol=1e-5)
+
+  def test_policy_does_not_leak(self):
+    """Tests that a bfloat16 model does not change later float32 models."""
+
+    params = model_configs.get_config('transformer_learn_values+test')
+    params.use_bfloat16 = True
+    model_utils.modify_params(params)
+    model_utils.get_model(params)
+    self.assertEqual(tf.keras.mixed_precision.global_policy().name, 'float32')
+    params.use_bfloat16 = False
+    model = model_utils.get_model(params)
+    # The encoder stack creates its sublayers when the model is built, so
+    # check every layer rather than only the top-level model.
+    for layer in model.submodules:
+      if isinstance(layer, tf.keras.layers.Layer):
+        self.assertEqual(layer.compute_dtype, 'float32')
+
 
 class ModifyParamsTest(parameterized.TestCase):
 
@@ -80,6 +173,71 @@ class ModifyParamsTest(parameterized.TestCase):
       self.assertEqual(params.batch_size, params.default_batch_size)
 
 
+class GetRecordShapeTest(absltest.TestCase):
+
+  def test_shape_read_from_testdata_summary(self):
+    """Tests that the summary written next to the testdata is used."""
+
+    tfrecord_file = test_utils.deepconsensus_testdata(
+        'human_1m/tf_examples/train/train.tfrecord.gz')
+    self.assertEqual(
+        model_utils.read_shape_from_summary(tfrecord_file), [85, 120, 1])
+
+  def test_shape_read_from_flat_summary(self):
+    """Tests the summary layout of --output=examples-@split.tfrecord.gz."""
+
+    data_dir = self.create_tempdir()
+    tfrecord_file = data_dir.create_file('examples-train.tfrecord.gz')
+    data_dir.create_file(
+        'examples-summary.training.json',
+        content=json.dumps({
+            'n_examples_train': 10,
+            'tensor_height': '45',
+            'tensor_width': '110'
+        }))
+    self.assertEqual(
+        model_utils.read_shape_from_summary(tfrecord_file.full_path),
+        [45, 110, 1])
+
+  def test_summary_for_other_split_ignored(self):
+    """Tests that a summary without examples for the split is not used."""
+
+    data_dir = self.create_tempdir()
+    tfrecord_file = data_dir.create_file('examples-train.tfrecord.gz')
+    data_dir.create_file(
+        'examples-summary.inference.json',
+        content=json.dumps({
+            'n_examples_inference': 10,
+            'tensor_height': '45',
+            'tensor_width': '110'
+        }))
+    self.assertIsNone(
+        model_utils.read_shape_from_summary(tfrecord_file.full_path))
+
+  def test_shape_read_from_records(self):
+    """Tests that records are read when there is no summary."""
+
+    data_dir = self.create_tempdir()
+    tfrecord_file = os.path.join(data_dir.full_path, 'train.tfrecord.gz')
+    tf.io.gfile.copy(
+        test_utils.deepconsensus_testdata(
+            'human_1m/tf_examples/train/train.tfrecord.gz'), tfrecord_file)
+    self.assertIsNone(model_utils.read_shape_from_summary(tfrecord_file))
+    self.assertEqual(model_utils.get_record_shape(tfrecord_file), [85, 120, 1])
+
+  def test_shape_is_cached(self):
+    """Tests that repeated lookups for the same path do not reread files."""
+
+    data_dir = self.create_tempdir()
+    tfrecord_file = os.path.join(data_dir.full_path, 'train.tfrecord.gz')
+    tf.io.gfile.copy(
+        test_utils.deepconsensus_testdata(
+            'human_1m/tf_examples/train/train.tfrecord.gz'), tfrecord_file)
+    self.assertEqual(model_utils.get_record_shape(tfrecord_file), [85, 120, 1])
+    tf.io.gfile.remove(tfrecord_file)
+    self.assertEqual(model_utils.extract_max_length(tfrecord_file), 120)
+
+
 class RunInferenceAndWriteResultsTest(absltest.TestCase):
 
   def test_output_dir_created(self):
@@ -27,6 +27,7 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """TF2 + tf.keras implementations of networks for DeepConsensus."""
 
+import functools
 import logging
 from typing import Callable, Optional, Tuple
 
@@ -52,6 +53,17 @@ class EmbeddingSharedWeights(embedding_layer.EmbeddingSharedWeights):
     return embeddings
 
 
+@functools.lru_cache(maxsize=8)
+def _get_position_encoding(length: int, hidden_size: int,
+                           dtype: str) -> tf.Tensor:
+  """Returns the sinusoidal position encoding, computed once per shape."""
+  # Created outside of any tf.function so that the cached tensor can be used by
+  # every graph that needs it.
+  with tf.init_scope():
+    return tf.cast(
+        model_utils.get_position_encoding(length, hidden_size), dtype)
+
+
 # pylint: disable=invalid-name
 def FullyConnectedNet(params: ml_collections.ConfigDict) -> tf.keras.Model:
   """Fully connected neural network architecture."""
@@ -71,7 +83,8 @@ def FullyConnectedNet(params: ml_collections.ConfigDict) -> tf.keras.Model:
 
   net = tf.keras.layers.Dense(units=params.max_length * params.num_classes)(net)
   net = tf.keras.layers.Reshape((params.max_length, params.num_classes))(net)
-  net = tf.keras.layers.Softmax(axis=-1)(net)
+  # Keep the output distribution in float32 under mixed precision.
+  net = tf.nn.softmax(tf.cast(net, tf.float32), axis=-1)
   outputs = net
   return tf.keras.Model(inputs=inputs, outputs=outputs)
 
@@ -113,6 +126,8 @@ class ConvNet(tf.keras.Model):
 
     # Define layers
     self.layer_dense = tf.keras.layers.Dense(units=self.dimensions)
+    self.flatten = tf.keras.layers.Flatten()
+    self.reshape = tf.keras.layers.Reshape((self.max_length, self.num_classes))
 
   def call(self, inputs: tf.Tensor, training: bool) -> tf.Tensor:
     # Most conv models only accept 3 channels;
@@ -127,16 +142,16 @@ class ConvNet(tf.keras.Model):
       logging.info('Using SN Values')
       # sn_rows was padded previously to match the input dimensions
       # Crop it here back to 4 rows.
-      sn_rows = tf.image.crop_to_bounding_box(sn_rows, 0, 0, 4, self.max_length)
-      sn_rows = tf.keras.layers.Flatten()(sn_rows)
-      net = tf.keras.layers.Flatten()(net)
+      sn_rows = sn_rows[:, :4, :self.max_length, :]
+      sn_rows = self.flatten(sn_rows)
+      net = self.flatten(net)
       net = tf.concat([net, sn_rows], 1)
     else:
-      net = tf.keras.layers.Flatten()(net)
+      net = self.flatten(net)
 
     net = self.layer_dense(net)
-    net = tf.keras.layers.Reshape((self.max_length, self.num_classes))(net)
-    net = tf.keras.layers.Softmax(axis=-1)(net)
+    net = self.reshape(net)
+    net = tf.nn.softmax(tf.cast(net, tf.float32), axis=-1)
     output = net
     return output
 
@@ -159,21 +174,24 @@ class EncoderOnlyTransformer(transformer.Transformer):
 
   def __init__(self,
                params: ml_collections.ConfigDict,
-               name: Optional[str] = None):
+               name: Optional[str] = None,
+               **kwargs):
     # Call grandparent super since we don't want to initialize embeddings.
-    super(transformer.Transformer, self).__init__(params, name=name)
+    super(transformer.Transformer, self).__init__(params, name=name, **kwargs)
     self.params = params
     if self.params.add_pos_encoding and self.params.use_relative_pos_enc:
       self.position_embedding = modeling.layers.position_embedding.RelativePositionEmbedding(
           hidden_size=self.params['hidden_size'])
     self.encoder_stack = transformer.EncoderStack(params)
-    self.fc1 = tf.keras.layers.Dense(
-        units=(params['vocab_size']),
+    # Per-position projection onto the vocabulary as a single einsum. Kernel
+    # and bias have the same names and shapes as the equivalent Dense layer.
+    self.fc1 = tf.keras.layers.experimental.EinsumDense(
+        'blh,hv->blv',
+        output_shape=(None, params['vocab_size']),
         activation=None,
-        use_bias=True,
+        bias_axes='v',
         kernel_initializer='glorot_uniform',
         bias_initializer='zeros')
-    self.softmax = tf.keras.layers.Softmax()
 
   def call(self, inputs: tf.Tensor, training: bool) -> tf.Tensor:
     """Runs a forward pass of the model.
@@ -201,8 +219,9 @@ class EncoderOnlyTransformer(transformer.Transformer):
       # Attention_bias for our model should be all 0s with shape
       # (batch_size, 1, 1, input_length). See model_utils.get_padding_bias
       # to see how this is calculated in the base model.
-      all_zeros = tf.reduce_sum(tf.zeros_like(inputs), -1)
-      attention_bias = tf.expand_dims(tf.expand_dims(all_zeros, 1), 1)
+      input_shape = tf.shape(inputs)
+      attention_bias = tf.zeros((input_shape[0], 1, 1, input_shape[1]),
+                                dtype=inputs.dtype)
 
       # Run the inputs through the encoder. Encoder returns the softmax output.
       encoder_outputs = self.encode(inputs, attention_bias, training)
@@ -225,18 +244,17 @@ class EncoderOnlyTransformer(transformer.Transformer):
       # Positional embedding only works when we have an even value for the
       # hidden_size. If hidden_size is odd, add an empty row to make it even.
       if self.params.add_pos_encoding and encoder_inputs.shape[2] % 2 != 0:
-        empty_row = tf.zeros(
-            shape=(encoder_inputs.shape[0], encoder_inputs.shape[1], 1))
-        encoder_inputs = tf.concat([encoder_inputs, empty_row], axis=-1)
+        encoder_inputs = tf.pad(encoder_inputs, [[0, 0], [0, 0], [0, 1]])
         assert self.params.hidden_size == encoder_inputs.shape[2]
 
       # All values in `input_padding` should be 0 and shape should be
       # (batch_size, input_length). See model_utils.get_padding to see how this
       # is computed for the base model.
-      inputs_padding = tf.reduce_sum(tf.zeros_like(encoder_inputs), -1)
+      inputs_padding = tf.zeros(
+          tf.shape(encoder_inputs)[:2], dtype=encoder_inputs.dtype)
 
       # Cast input `attention_bias` to correct type, as done in the base model.
-      attention_bias = tf.cast(attention_bias, self.params['dtype'])
+      attention_bias = tf.cast(attention_bias, self.compute_dtype)
 
       # Add positional encoding to the input. The scale of the positional
       # encoding relative to the input values will matter since we are not
@@ -245,10 +263,13 @@ class EncoderOnlyTransformer(transformer.Transformer):
         with tf.name_scope('add_pos_encoding'):
           if self.params['use_relative_pos_enc']:
             pos_encoding = self.position_embedding(inputs=encoder_inputs)
+            pos_encoding = tf.cast(pos_encoding, self.compute_dtype)
           else:
-            pos_encoding = model_utils.get_position_encoding(
-                self.params['max_length'], self.params['hidden_size'])
-          pos_encoding = tf.cast(pos_encoding, self.params['dtype'])
+            # Sized from the inputs, since max_length in params can be changed
+            # after the model is created (e.g. for padded inference examples).
+            pos_encoding = _get_position_encoding(
+                encoder_inputs.shape[1] or self.params['max_length'],
+                self.params['hidden_size'], self.compute_dtype)
           encoder_inputs += pos_encoding
 
       # Add dropout when training.
@@ -264,7 +285,9 @@ class EncoderOnlyTransformer(transformer.Transformer):
 
       # Pass through dense layer, and output a distribution.
       encoder_outputs = self.fc1(encoder_outputs)
-      encoder_outputs = self.softmax(encoder_outputs)
+      # Keep the output distribution in float32 under mixed precision.
+      encoder_outputs = tf.nn.softmax(
+          tf.cast(encoder_outputs, tf.float32), axis=-1)
       return encoder_outputs
 
   def decode(self, encoder_outputs: tf.Tensor, attention_bias: tf.Tensor,
@@ -290,7 +313,15 @@ class EncoderOnlyLearnedValuesTransformer(EncoderOnlyTransformer):
   def __init__(self,
                params: ml_collections.ConfigDict,
                name: Optional[str] = None):
-    super(EncoderOnlyLearnedValuesTransformer, self).__init__(params, name=name)
+    # The input rows hold integer ids (e.g. SN values up to SN_MAX) that must be
+    # read at full precision before the embedding lookup. Under a mixed policy,
+    # autocasting would round them to the compute dtype first, so keep the
+    # inputs in float32 and only cast the embeddings in `encode`.
+    super(EncoderOnlyLearnedValuesTransformer, self).__init__(
+        params, name=name, autocast=False)
+    (self.base_indices, self.pw_indices, self.ip_indices, self.strand_indices,
+     self.ccs_indices,
+     self.sn_indices) = data_providers.get_indices(params['max_passes'])
     if params.use_bases:
       self.bases_embedding_layer = EmbeddingSharedWeights(
           params['vocab_size'], params['per_base_hidden_size'])
@@ -314,59 +345,72 @@ class EncoderOnlyLearnedValuesTransformer(EncoderOnlyTransformer):
       self.strand_embedding_layer = EmbeddingSharedWeights(
           strand_vocab_size, params['strand_hidden_size'])
 
+  def _embed_rows(self, embedding_layer: tf.keras.layers.Layer,
+                  inputs: tf.Tensor, indices: Tuple[int, int]) -> tf.Tensor:
+    """Embeds the rows in [start, end) of `inputs` with a single lookup.
+
+    Args:
+      embedding_layer: layer used to embed every row in the range.
+      inputs: tensor of shape (batch_size, input_length, num_rows).
+      indices: (start, end) range of rows to embed.
+
+    Returns:
+      Tensor of shape (batch_size, input_length, num_embedded * embedding_size),
+      equal to concatenating the embeddings of each row in order.
+    """
+    start, end = indices
+    # `inputs` is not autocast, so the ids are truncated from float32 values.
+    # Shape: [batch_size, length, end - start, embedding_size]
+    embedded = embedding_layer(tf.cast(inputs[:, :, start:end], tf.int32))
+    shape = tf.shape(embedded)
+    return tf.reshape(embedded,
+                      [shape[0], shape[1], (end - start) * embedded.shape[-1]])
+
   def encode(self, inputs: tf.Tensor, attention_bias: tf.Tensor,
              training: bool) -> tf.Tensor:
     """Runs the input through Encoder stack and problem-specific layers."""
 
-    # Input to embedding layer is [batch_size, length] and output will be
-    # [batch_size, length, embedding_size]. Embed each row of the input
-    # separately and then concatenate.
+    # Input to embedding layer is [batch_size, length, num_rows] and output
+    # will be [batch_size, length, num_rows, embedding_size]. Embed each group
+    # of rows at once, flatten the rows into the last dimension and then
+    # concatenate.
     embedded_inputs = []
-    base_indices, pw_indices, ip_indices, strand_indices, ccs_indices, sn_indices = data_providers.get_indices(
-        self.params['max_passes'])
     if self.params.use_bases:
-      for i in range(*base_indices):
-        # Shape: [batch_size, length, per_base_hidden_size]
-        embedded = self.bases_embedding_layer(
-            tf.cast(inputs[:, :, i], tf.int32))
-        embedded_inputs.append(embedded)
-
+      # Shape: [batch_size, length, num_passes * per_base_hidden_size]
+      embedded_inputs.append(
+          self._embed_rows(self.bases_embedding_layer, inputs,
+                           self.base_indices))
 
     if self.params.use_pw:
-      for i in range(*pw_indices):
-        # Shape: [batch_size, length, pw_hidden_size]
-        embedded = self.pw_embedding_layer(tf.cast(inputs[:, :, i], tf.int32))
-        embedded_inputs.append(embedded)
+      # Shape: [batch_size, length, num_passes * pw_hidden_size]
+      embedded_inputs.append(
+          self._embed_rows(self.pw_embedding_layer, inputs, self.pw_indices))
 
     if self.params.use_ip:
-      for i in range(*ip_indices):
-        # Shape: [batch_size, length, ip_hidden_size]
-        embedded = self.ip_embedding_layer(tf.cast(inputs[:, :, i], tf.int32))
-        embedded_inputs.append(embedded)
+      # Shape: [batch_size, length, num_passes * ip_hidden_size]
+      embedded_inputs.append(
+          self._embed_rows(self.ip_embedding_layer, inputs, self.ip_indices))
 
     if self.params.use_strand:
-      for i in range(*strand_indices):
-        embedded = self.strand_embedding_layer(
-            tf.cast(inputs[:, :, i], tf.int32))
-        embedded_inputs.append(embedded)
+      embedded_inputs.append(
+          self._embed_rows(self.strand_embedding_layer, inputs,
+                           self.strand_indices))
 
     if self.params.use_ccs:
-      for i in range(*ccs_indices):
-        embedded = self.bases_embedding_layer(
-            tf.cast(inputs[:, :, i], tf.int32))
-        embedded_inputs.append(embedded)
+      embedded_inputs.append(
+          self._embed_rows(self.bases_embedding_layer, inputs,
+                           self.ccs_indices))
 
     # TODO: experiment with computing a weighted average using snr as
     # weights to aggregate subread-level embeddings (instead of concatenating).
     if self.params.use_sn:
       # The last four elements in the last dimension in the inputs tensor
       # correspond to the four signal-to-noise ratio scores for A, G, C, T.
-      for i in range(*sn_indices):
-        embedded = self.sn_embedding_layer(tf.cast(inputs[:, :, i], tf.int32))
-        embedded_inputs.append(embedded)
+      embedded_inputs.append(
+          self._embed_rows(self.sn_embedding_layer, inputs, self.sn_indices))
 
     embedded_inputs = tf.concat(embedded_inputs, axis=-1)
-    embedded_inputs = tf.cast(embedded_inputs, self.params['dtype'])
+    embedded_inputs = tf.cast(embedded_inputs, self.compute_dtype)
 
     if self.params.condense_transformer_input:
       # Condense the transformer input at each position to a smaller vector to
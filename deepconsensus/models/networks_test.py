@@ -116,5 +116,20 @@ class ModelsTest(parameterized.TestCase):
     self.assertTrue(
         np.allclose(softmax_output_predict, softmax_output, rtol=1e-05))
 
+  @parameterized.parameters(
+      ['transformer+test', 'transformer_learn_values+test'])
+  def test_transformer_length_changed_after_creation(self, config_name):
+    """Checks the sinusoidal encoding follows the length of the inputs."""
+    params = model_configs.get_config(config_name)
+    params.use_relative_pos_enc = False
+    model_utils.modify_params(params)
+    model = model_utils.get_model(params)
+    num_rows, max_length, num_channels = data_providers.get_input_shape(params)
+    padded_length = max_length + 10
+    softmax_output = model(
+        tf.zeros((1, num_rows, padded_length, num_channels)), training=False)
+    self.assertEqual(softmax_output.shape,
+                     (1, padded_length, params.num_classes))
+
 if __name__ == '__main__':
   absltest.main()
@@ -27,7 +27,9 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """Utilities for error analysis that can be used in colab."""
 
-from typing import List, Tuple
+import concurrent.futures
+import functools
+from typing import List, Tuple, Union
 
 import numpy as np
 import pandas as pd
@@ -44,11 +46,16 @@ WRITE_YELLOW_BACKGROUND = '\x1b[103m'
 
 KMER_SIZE = 10
 
+# Deletes gap/padding characters in a single str.translate pass.
+_GAP_TABLE = str.maketrans('', '', dc_constants.GAP_OR_PAD)
+
+# Maps each vocab index to the ASCII code of its base.
+_VOCAB_LUT = np.frombuffer(dc_constants.VOCAB.encode('ascii'), dtype=np.uint8)
+
 
 def remove_gaps(seq: str) -> str:
   """Removes gaps and padding from sequences."""
-  seq = seq.replace(dc_constants.GAP_OR_PAD, '')
-  return seq
+  return seq.translate(_GAP_TABLE)
 
 
 def get_deepconsensus_prediction(
@@ -64,9 +71,17 @@ def check_has_errors(label: str, pred: str) -> bool:
   return remove_gaps(label) != remove_gaps(pred)
 
 
-def ints_to_bases(bases_row: tf.Tensor) -> str:
+def ints_to_bases(bases_row: Union[tf.Tensor, np.ndarray]) -> str:
   """Converts ints to bases based on order in the vocab."""
-  return ''.join([dc_constants.VOCAB[int(b)] for b in bases_row])
+  indices = np.asarray(bases_row).astype(np.intp)
+  return _VOCAB_LUT[indices].tobytes().decode('ascii')
+
+
+@functools.lru_cache(maxsize=8)
+def _subread_rows_range(max_passes: int) -> range:
+  """Returns the range of subread base rows for the given max_passes."""
+  base_indices, _, _, _, _, _ = data_providers.get_indices(max_passes)
+  return range(*base_indices)
 
 
 def convert_to_bases(rows: tf.Tensor, label: tf.Tensor,
@@ -76,10 +91,10 @@ def convert_to_bases(rows: tf.Tensor, label: tf.Tensor,
   rows = tf.squeeze(rows)
   label = tf.squeeze(label)
   deepconsensus_pred = tf.squeeze(deepconsensus_pred)
-  base_indices, _, _, _, _, _ = data_providers.get_indices(max_passes)
-  subread_rows_range = range(*base_indices)
-  subread_rows = [rows[i, :].numpy() for i in subread_rows_range]
-  subread_rows = [row for row in subread_rows if np.sum(row) != 0]
+  subread_rows_range = _subread_rows_range(max_passes)
+  subread_rows = rows.numpy()[subread_rows_range.start:subread_rows_range.stop]
+  # Drop all-zero rows, which are padding for missing subreads.
+  subread_rows = subread_rows[np.any(subread_rows != 0, axis=1)]
   subread_bases = [ints_to_bases(subread_row) for subread_row in subread_rows]
 
   label_bases = ints_to_bases(label)
@@ -87,55 +102,64 @@ def convert_to_bases(rows: tf.Tensor, label: tf.Tensor,
   return subread_bases, label_bases, deepconsensus_pred_bases
 
 
+def _prefix_bases(bases: str, sep: str) -> str:
+  """Returns `bases` with `sep` inserted before every base."""
+  return sep + sep.join(bases) if bases else ''
+
+
 def pretty_print_proto(dc_input, print_aux=False):
   """Prints fields from the given DeepConsensusInput proto."""
-  spaces = 3 if print_aux else 0
-  bases_list = list(str(dc_input.label.bases))
+  # Each base is prefixed with `sep` so that bases line up with the 4-wide
+  # PW/IP columns printed below.
+  sep = ' ' * 3 if print_aux else ''
   print('Label:')
-  print(''.join([' ' * spaces + base for base in bases_list]))
+  print(_prefix_bases(str(dc_input.label.bases), sep))
   print('\n')
   print('Subreads:')
   for read in dc_input.subreads:
-    bases_list = list(str(read.bases))
-    print(''.join([' ' * spaces + base for base in bases_list]))
+    print(_prefix_bases(str(read.bases), sep))
   if print_aux:
     print('\n')
     print('PW:')
     for read in dc_input.subreads:
-      bases_list = list(str(read.bases))
-      print(''.join(['%4d' % value for value in read.pw]))
+      print(''.join([f'{value:4d}' for value in read.pw]))
     print('\n')
     print('IP:')
     for read in dc_input.subreads:
-      bases_list = list(str(read.bases))
-      print(''.join(['%4d' % value for value in read.ip]))
+      print(''.join([f'{value:4d}' for value in read.ip]))
     print('\n')
     print('Strand:')
     for read in dc_input.subreads:
-      print('%4d' % read.subread_strand * len(read.bases))
+      print(f'{read.subread_strand:4d}' * len(read.bases))
+
+
+def _read_inference_csv(inference_csv: str) -> pd.DataFrame:
+  """Reads the first rows of one inference CSV and labels its work unit."""
+  curr_df = pd.read_csv(tf.io.gfile.GFile(inference_csv), nrows=2)
+  curr_df['experiment_and_work_unit'] = '/'.join(
+      inference_csv.split('/')[-3:-1])
+  curr_df['dataset_type'] = 'eval'
+  return curr_df
 
 
 def get_results_df(experiments: List[int],
                    experiment_pattern: str,
-                   decimals: int = 5) -> pd.DataFrame:
+                   decimals: int = 5,
+                   max_workers: int = 32) -> pd.DataFrame:
   """Returns a dataframe with inference results."""
-  all_lines = None
-  for experiment in experiments:
-    # `experiment_pattern` should contain '{}' that can be filled in with the
-    # experiment number.
-    inference_csvs = tf.io.gfile.glob(experiment_pattern.format(experiment))
-    for inference_csv in inference_csvs:
-      n_rows = 2
-      curr_df = pd.read_csv(tf.io.gfile.GFile(inference_csv), nrows=n_rows)
-      curr_df['experiment_and_work_unit'] = [
-          '/'.join(inference_csv.split('/')[-3:-1])
-      ] * n_rows
-      curr_df['dataset_type'] = 'eval'
-      if all_lines is None:
-        all_lines = curr_df
-      else:
-        all_lines = pd.concat([all_lines, curr_df], ignore_index=True)
-  assert all_lines is not None
+  # `experiment_pattern` should contain '{}' that can be filled in with the
+  # experiment number.
+  inference_csvs = [
+      inference_csv for experiment in experiments
+      for inference_csv in tf.io.gfile.glob(
+          experiment_pattern.format(experiment))
+  ]
+  # Files are often on remote storage, so read them concurrently. `map` keeps
+  # the frames in the same order as `inference_csvs`.
+  with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+    frames = list(executor.map(_read_inference_csv, inference_csvs))
+  assert frames
+  all_lines = pd.concat(frames, ignore_index=True)
   cols = all_lines.columns.tolist()
   reordered_columns = cols[-2:] + cols[1:-2] + [cols[0]]
   all_lines = all_lines[reordered_columns]